@@ -18,15 +18,17 @@ if __name__ == "__main__":
     parser.add_argument("-c", "--nclass", type=int,
                         help="Number of class. Must be at least 2 aka two-classification.", default=2)
     parser.add_argument("-e", "--epochs", type=int,
-                        help="Number of training epochs.", default=20)
+                        help="Number of training steps. Each step trains on one mini-batch (or on all training samples if --batchsize is 0).", default=20)
+    parser.add_argument("--stepsperrun", type=int,
+                        help="Number of training steps executed in a single session run. Must be at least 1.", default=10)
     parser.add_argument("-k", "--kfolds", type=int,
                         help="Number of folds. Must be at least 2.", default=10)
     parser.add_argument("-s", "--batchsize", type=int,
-                        help="Subsampling size in training. If 0, all samples will be training.", default=0)
+                        help="Mini-batch size in training, drawn from the reshuffled training set. If 0, all samples will be training in every step.", default=0)
     parser.add_argument("-d", "--dropout", type=float,
                         help="The dropout rate, between 0 and 1. E.g. rate=0.1 would drop out 10%% of input units.", default=0.1)
     parser.add_argument("-r", "--randomseed", type=int,
-                        help="pseudo-random number generator state used for shuffling.", default=None)
+                        help="pseudo-random number generator state used for k-fold splitting and mini-batch shuffling.", default=None)
     parser.add_argument("--conv1h", type=int,
                         help="Specifying the height of the 1st 2D convolution window.", default=5)
     parser.add_argument("--conv1w", type=int,
@@ -45,17 +47,25 @@ if __name__ == "__main__":
     #                     help='GPU to use (leave blank for CPU only)', default="")
     parser.add_argument("--datapath", type=str,
                         help="The path of dataset.", required=True)
+    parser.add_argument("--cachepath", type=str,
+                        help="The path of the preprocessed dataset cache (.npy). If set, samples are parsed once into this memory-mapped file, which is rebuilt when the dataset files change. If not set, no cache is written.", default=None)
+    parser.add_argument("--aotdir", type=str,
+                        help="The directory to export the frozen test graph and tfcompile (XLA AOT) config. If not set, nothing is exported.", default=None)
+    parser.add_argument("--fp16", action="store_true",
+                        help="Train with float16 mixed precision. Only faster on GPUs with Tensor Cores (Volta or newer).")
     parser.add_argument("--learningrate", type=float,
                         help="Learning rate.", default=1e-3)
     # parser.add_argument("--logdir", type=str, help="The directory for TF logs and summaries.", default="logs")
 
     args = parser.parse_args()
+    if args.stepsperrun < 1:
+        parser.error("--stepsperrun must be at least 1")
     # os.environ['CUDA_VISIBLE_DEVICES'] = args.gpuid
     # logdir_base = os.getcwd()  # 获取当前目录
 
     # 输出CNN模型相关训练参数
     print("\nCNN HyperParameters:")
-    print("\nN-classes:{0}, Training epochs:{1}, Learning rate:{2}, Dropout rate:{3}".format(
+    print("\nN-classes:{0}, Training steps:{1}, Learning rate:{2}, Dropout rate:{3}".format(
         args.nclass, args.epochs, args.learningrate, args.dropout))
     print("\nThe kernel size of the 1st 2D convolution window: [{0}, {1}], The number of filters: 32".format(
         args.conv1h, args.conv1w))
@@ -75,7 +85,7 @@ if __name__ == "__main__":
     # for TF to load, in case the arguments aren't ok
     from cnn.cnn_bio import run_model
     run_model(args.datapath, args.learningrate, args.epochs, args.dropout, args.conv1h, args.conv1w, args.conv2h,
-              args.conv2w, args.conv2f, args.datah, args.dataw, args.nclass, args.kfolds, args.randomseed)
+              args.conv2w, args.conv2f, args.datah, args.dataw, args.nclass, args.kfolds, args.randomseed, args.batchsize, args.cachepath, args.aotdir, args.stepsperrun, args.fp16)
     end_time = time.time()  # 程序结束时间
     print("\n[Finished in: {0:.6f} mins = {1:.6f} seconds]".format(
         ((end_time - start_time) / 60), (end_time - start_time)))
@@ -15,7 +15,6 @@ import os
 import numpy as np
 import pandas as pd
 import tensorflow as tf
-from sklearn.preprocessing import StandardScaler
 from sklearn.model_selection import KFold
 # from sklearn.utils import resample  # 添加 subsampling 工具类
 __author__ = 'Min'
@@ -64,35 +63,81 @@ def read_data(file_path, data_height, data_width):
     Returns:
      numpy 格式矩阵
     """
-    result = list()
-    with open(file_path, 'r', encoding='utf-8') as f:
-        # 读取首行分类信息
-        for line in f.readlines():
-            line = line.strip()
-            # 过滤首行分类信息和文件末尾空行
-            if len(line) > 0 and not line.startswith('>'):
-                # 逐行存入矩阵信息
-                result.append(line.split())
-    # 转换至 numpy array 格式
-    mat = np.array(result, dtype=np.float)
+    # 首行分类信息以 '>' 开头，作为注释跳过；空行由 loadtxt 自动忽略
+    mat = np.loadtxt(file_path, comments='>', dtype=np.float32, ndmin=2, encoding='utf-8')
     if mat.shape[0] > data_height:
         # 超出 Max Height 则矩阵做截断
         new_mat = mat[0:data_height, ]
     else:
         # 矩阵填充 padding with 0
         new_mat = np.lib.pad(mat, ((
-            0, data_height - mat.shape[0]), (0, 0)), 'constant', constant_values=0)
-    # 标准化处理
-    # scale = StandardScaler()
-    # 按列 Standardize features by removing the mean and scaling to unit variance
-    # scale.fit(mat)
+            0, data_height - mat.shape[0]), (0, 0)), 'constant', constant_values=np.float32(0))
     # 2-D array 转换为 3-D array [Height, Width, Channel]
-    # new_mat = scale.transform(mat)[:, :, np.newaxis]
-    new_mat = new_mat.reshape((data_height, data_width, 1))
-    return new_mat
+    return np.ascontiguousarray(new_mat.reshape((data_height, data_width, 1)), dtype=np.float32)
 
 
-def conv_net(x, n_classes, c1_k_h, c1_k_w, c2_k_h, c2_k_w, c2_f, dropout, reuse, is_training):
+def preprocess_to_cache(dataset_path, cache_path, data_height, data_width):
+    """将全部样本矩阵一次性解析并写入 .npy 缓存文件，训练时以 memmap 方式读取
+
+    Args:
+     dataset_path: 数据集路径
+     cache_path: 样本矩阵缓存文件路径 (.npy)，样本文件列表及修改时间另存为同名 .npz
+     data_height: 样本矩阵长度
+     data_width: 样本矩阵宽度
+
+    Returns:
+     返回样本文件列表及对应分类列表
+    """
+    from .utils import load_samples
+    sample_paths, sample_labels = get_datasets(dataset_path)
+    samples = np.lib.format.open_memmap(cache_path, mode='w+', dtype=np.float32,
+                                        shape=(len(sample_paths), data_height, data_width, 1))
+    # 多线程并行解析样本文件
+    load_samples(lambda path: read_data(path, data_height, data_width),
+                 sample_paths, (data_height, data_width, 1), out=samples)
+    samples.flush()
+    del samples
+    np.savez(os.path.splitext(cache_path)[0] + '.npz',
+             paths=np.array(sample_paths),
+             mtimes=np.array([os.path.getmtime(path) for path in sample_paths]))
+    return sample_paths, sample_labels
+
+
+def is_cache_valid(cache_path, sample_paths, data_height, data_width):
+    """检查样本矩阵缓存是否与当前数据集一致（样本矩阵维度、样本文件列表及修改时间均相同）
+
+    Args:
+     cache_path: 样本矩阵缓存文件路径 (.npy)
+     sample_paths: 当前数据集样本文件列表
+     data_height: 样本矩阵长度
+     data_width: 样本矩阵宽度
+
+    Returns:
+     缓存可用返回 True，否则返回 False
+    """
+    index_path = os.path.splitext(cache_path)[0] + '.npz'
+    if not (os.path.isfile(cache_path) and os.path.isfile(index_path)):
+        return False
+    # 样本矩阵长度或宽度改变后需重新生成缓存
+    if np.load(cache_path, mmap_mode='r').shape != (len(sample_paths), data_height, data_width, 1):
+        return False
+    with np.load(index_path) as cache_index:
+        if 'mtimes' not in cache_index.files or cache_index['paths'].tolist() != list(sample_paths):
+            return False
+        mtimes = np.array([os.path.getmtime(path) for path in sample_paths])
+        return np.array_equal(cache_index['mtimes'], mtimes)
+
+
+def fp32_storage_getter(getter, name, shape=None, dtype=None, trainable=True, *args, **kwargs):
+    """混合精度训练时权重仍以 float32 存储和更新，读取时再转换为计算精度 (float16)"""
+    variable = getter(name, shape, dtype=tf.float32 if trainable else dtype,
+                      trainable=trainable, *args, **kwargs)
+    if trainable and dtype != tf.float32:
+        variable = tf.cast(variable, dtype)
+    return variable
+
+
+def conv_net(x, n_classes, c1_k_h, c1_k_w, c2_k_h, c2_k_w, c2_f, dropout, reuse, is_training, data_format='channels_last', use_fp16=False, init_stddev=0.001):
     """ 基本卷积神经网络构建
 
     Args:
@@ -101,13 +146,17 @@ def conv_net(x, n_classes, c1_k_h, c1_k_w, c2_k_h, c2_k_w, c2_f, dropout, reuse,
      `dropout`: Dropout 概率
      `reuse`: 是否应用同样的权重矩阵
      `is_training`: 网络是否在训练状态
+     `data_format`: 卷积与池化层的数据格式，GPU 上使用 'channels_first' (NCHW) 以匹配 cuDNN 内部格式
+     `use_fp16`: 是否以 float16 进行卷积与全连接层计算（输出仍为 float32）
+     `init_stddev`: 卷积层及1024单元全连接层权重的正态分布初始化标准差，为 None 则使用 glorot_uniform
 
     Returns:
-     全连接层输出
+     输出层 logits（未经 softmax）及全连接层输出
 
     """
     # Define a scope for reusing the variables
-    with tf.variable_scope('ConvNet', reuse=reuse):
+    with tf.variable_scope('ConvNet', reuse=reuse,
+                           custom_getter=fp32_storage_getter if use_fp16 else None):
         """
         data input is a 1-D vector of (DATA_HEIGHT*DATA_WIDTH) features
         Reshape to format [Height x Width x Channel]
@@ -116,58 +165,77 @@ def conv_net(x, n_classes, c1_k_h, c1_k_w, c2_k_h, c2_k_w, c2_f, dropout, reuse,
         在给定的 4-D input与 filter下计算2D卷积
         """
         # x = tf.reshape(x, shape=[-1, DATA_HEIGHT, DATA_WIDTH, 1])
+        weight_init = tf.random_normal_initializer(
+            stddev=init_stddev) if init_stddev is not None else tf.glorot_uniform_initializer()
+        if data_format == 'channels_first':
+            # [Batch Size, Height, Width, Channel] 转换为 [Batch Size, Channel, Height, Width]
+            x = tf.transpose(x, [0, 3, 1, 2])
+        if use_fp16:
+            # 激活值以 float16 计算，可使用 GPU Tensor Core
+            x = tf.cast(x, tf.float16)
 
         # Convolution Layer 1 with 32 filters and a kernel size of 5
         # 卷积层1：卷积核大小为 5x5，卷积核数量为 32， 激活函数使用 RELU
         conv1 = tf.layers.conv2d(x, 32,
                                  kernel_size=[c1_k_h, c1_k_w],
-                                 kernel_initializer=tf.random_normal_initializer(
-                                     stddev=0.001),
+                                 kernel_initializer=weight_init,
                                  bias_initializer=tf.random_normal_initializer(
                                      stddev=0),
-                                 activation=tf.nn.relu)
+                                 activation=tf.nn.relu,
+                                 data_format=data_format)
         # Max Pooling (down-sampling) with strides of 2 and kernel size of 2
         # 采用 2x2 维度的最大化池化操作，步长为2
-        pool1 = tf.layers.max_pooling2d(conv1, 2, 2)
+        pool1 = tf.layers.max_pooling2d(
+            conv1, 2, 2, data_format=data_format)
 
         # Convolution Layer 2 with 64 filters and a kernel size of 3
         # 卷积层2：卷积核大小为 3x3，卷积核数量默认为 64， 激活函数使用 RELU
         conv2 = tf.layers.conv2d(pool1, c2_f,
                                  kernel_size=[c2_k_h, c2_k_w],
-                                 kernel_initializer=tf.random_normal_initializer(
-                                     stddev=0.001),
+                                 kernel_initializer=weight_init,
                                  bias_initializer=tf.random_normal_initializer(
                                      stddev=0),
-                                 activation=tf.nn.relu)
+                                 activation=tf.nn.relu,
+                                 data_format=data_format)
         # Max Pooling (down-sampling) with strides of 2 and kernel size of 2
         # 采用 2x2 维度的最大化池化操作，步长为2
-        pool2 = tf.layers.max_pooling2d(conv2, 2, 2)
+        pool2 = tf.layers.max_pooling2d(
+            conv2, 2, 2, data_format=data_format)
 
         # Flatten the data to a 1-D vector for the fully connected layer
         fc1 = tf.contrib.layers.flatten(pool2)
 
-        # Fully connected layer (in contrib folder for now)
-        # 全链接层具有1024神经元
-        fc2 = tf.layers.dense(fc1,
-                              units=1024,
-                              kernel_initializer=tf.random_normal_initializer(
-                                  stddev=0.001),
-                              bias_initializer=tf.random_normal_initializer(stddev=0))
+        # Fully connected layer
+        # 全链接层具有1024神经元，显式 matmul + bias_add 以便 XLA 与 dropout 融合为单个 kernel
+        w_fc1 = tf.get_variable('W_fc1', [fc1.get_shape().as_list()[1], 1024], dtype=fc1.dtype,
+                                initializer=weight_init)
+        b_fc1 = tf.get_variable('b_fc1', [1024], dtype=fc1.dtype,
+                                initializer=tf.random_normal_initializer(stddev=0))
+        fc2 = tf.nn.bias_add(tf.matmul(fc1, w_fc1), b_fc1)
         # Apply Dropout (if is_training is False, dropout is not applied)
         # 对全链接层的数据加入dropout操作，防止过拟合
-        fc2 = tf.layers.dropout(fc2, rate=dropout, training=is_training)
+        fc2 = tf.layers.dropout(fc2, rate=tf.cast(
+            dropout, fc2.dtype), training=is_training)
 
         # Output layer, class prediction
-        out = tf.layers.dense(fc2, n_classes)
-        # Because 'softmax_cross_entropy_with_logits' already apply softmax,
-        # we only apply softmax to testing network
-        # 输出层 (Softmax层)，对dropout层的输出Tensor，执行分类操作
-        out = tf.nn.softmax(out) if not is_training else out
+        w_out = tf.get_variable('W_out', [1024, n_classes], dtype=fc2.dtype,
+                                initializer=tf.glorot_uniform_initializer())
+        b_out = tf.get_variable('b_out', [n_classes], dtype=fc2.dtype,
+                                initializer=tf.zeros_initializer())
+        out = tf.nn.bias_add(tf.matmul(fc2, w_out), b_out)
+        if use_fp16:
+            # softmax / cross-entropy 及输出特征保持 float32 精度
+            out = tf.cast(out, tf.float32)
+            fc1 = tf.cast(fc1, tf.float32)
+            fc2 = tf.cast(fc2, tf.float32)
+        # 'softmax_cross_entropy_with_logits' already apply softmax, and softmax
+        # is monotonic, so testing network predicts with argmax on raw logits
+        # 输出层直接返回 logits，需要概率时再对其执行 tf.nn.softmax
 
     return out, fc1, fc2
 
 
-def run_model(d_path, l_rate, n_steps, d_rate, conv1_h, conv1_w, conv2_h, conv2_w, filter2, data_height, data_width, n_classes, folds, seed):
+def run_model(d_path, l_rate, n_steps, d_rate, conv1_h, conv1_w, conv2_h, conv2_w, filter2, data_height, data_width, n_classes, folds, seed, b_size=0, cache_path=None, aot_dir=None, steps_per_run=10, use_fp16=False):
     """运行 CNN 模型
 
     Args:
@@ -184,39 +252,158 @@ def run_model(d_path, l_rate, n_steps, d_rate, conv1_h, conv1_w, conv2_h, conv2_
       data_width: 样本矩阵宽度
       n_classes: 分类问题数
       folds: k-fold 次数
+      b_size: 每次训练取样大小（为 0 则全部样本进入训练）
+      cache_path: 样本矩阵缓存文件路径，为 None 则不使用缓存，每次直接读取样本文件
+      aot_dir: 测试网络 tfcompile (XLA AOT) 导出目录，为 None 则不导出
+      steps_per_run: 每次 sess.run 连续执行的训练次数
+      use_fp16: 是否以 float16 混合精度训练（仅在具有 Tensor Core 的 GPU 上有加速效果）
     """
-    # 特征和分类矩阵占位符
-    X = tf.placeholder(tf.float32, shape=[None, data_height, data_width, 1])
-    y = tf.placeholder(tf.int32)
+    if steps_per_run < 1:
+        raise ValueError(
+            "steps_per_run must be at least 1, got {0}".format(steps_per_run))
+    # 读取数据
+    traning_set, training_labels = get_datasets(d_path)
+    if cache_path is not None:
+        # 缓存不存在、数据集或样本矩阵维度已变化时重新生成样本矩阵缓存，之后直接 memmap 读取
+        if not is_cache_valid(cache_path, traning_set, data_height, data_width):
+            traning_set, training_labels = preprocess_to_cache(
+                d_path, cache_path, data_height, data_width)
+        samples = np.load(cache_path, mmap_mode='r')
+
+        def load_sample(i):
+            return np.array(samples[i])
+    else:
+        def load_sample(i):
+            return read_data(traning_set[i], data_height, data_width)
+    sample_labels = np.array(training_labels, dtype=np.int32)
+
+    def parse_sample(index, label):
+        """在 tf.data pipeline 中读取单个样本矩阵"""
+        sample = tf.py_func(load_sample, [index], tf.float32, stateful=False)
+        sample.set_shape([data_height, data_width, 1])
+        return sample, label
+
+    def make_dataset(index, is_training):
+        """构建训练集 / 测试集 tf.data pipeline，样本读取与 GPU 计算重叠进行
+
+        `index` 为样本索引 placeholder，每个 fold 只需喂入新的索引重新初始化 iterator
+        """
+        n_samples = tf.size(index, out_type=tf.int64)
+        dataset = tf.data.Dataset.from_tensor_slices(
+            (index, tf.gather(labels_const, index)))
+        dataset = dataset.map(
+            parse_sample, num_parallel_calls=tf.data.experimental.AUTOTUNE)
+        if is_training:
+            # 训练集样本矩阵只在第一个 epoch 读取，之后直接使用内存中的缓存
+            # 每个 step 重新打乱训练集顺序（在 cache 之后打乱，不会重复读取）
+            dataset = dataset.cache().shuffle(n_samples, seed=seed).repeat()
+            batch_size = b_size if b_size > 0 else n_samples
+        else:
+            # 测试集一次全部进入评估
+            batch_size = n_samples
+        dataset = dataset.batch(batch_size)
+        return dataset.prefetch(tf.data.experimental.AUTOTUNE)
+
+    # 训练集、测试集 pipeline 及 iterator 初始化操作只构建一次，所有 fold 共用
+    labels_const = tf.constant(sample_labels)
+    train_idx = tf.placeholder(tf.int64, [None])
+    test_idx = tf.placeholder(tf.int64, [None])
+    # 特征和分类矩阵由 dataset iterator 直接提供，每个 fold 喂入新的索引重新初始化
+    iterator = tf.data.Iterator.from_structure(
+        (tf.float32, tf.int32),
+        (tf.TensorShape([None, data_height, data_width, 1]), tf.TensorShape([None])))
+    train_init = iterator.make_initializer(
+        make_dataset(train_idx, is_training=True))
+    test_init = iterator.make_initializer(
+        make_dataset(test_idx, is_training=False))
+    X, y = iterator.get_next(name="batch")
     dropout = tf.placeholder(tf.float32)  # dropout (keep probability)
+    # GPU 上卷积采用 NCHW 格式，CPU 上的卷积不支持 NCHW 保持 NHWC
+    data_format = 'channels_first' if tf.test.is_gpu_available() else 'channels_last'
 
     # Because Dropout have different behavior at training and prediction time, we
     # need to create 2 distinct computation graphs that share the same weights.
-    # Create a graph for training
+    # Create a graph for training (creates the shared weights, training steps run in the while_loop below)
     logits_train, features_train, f1024_train = conv_net(
-        X, n_classes, conv1_h, conv1_w, conv2_h, conv2_w, filter2, dropout, reuse=False, is_training=True)
+        X, n_classes, conv1_h, conv1_w, conv2_h, conv2_w, filter2, dropout, reuse=False, is_training=True, data_format=data_format, use_fp16=use_fp16)
     # Create another graph for testing that reuse the same weights
     logits_test, features_test, f1024_test = conv_net(
-        X, n_classes, conv1_h, conv1_w, conv2_h, conv2_w, filter2, dropout, reuse=True, is_training=False)
+        X, n_classes, conv1_h, conv1_w, conv2_h, conv2_w, filter2, dropout, reuse=True, is_training=False, data_format=data_format, use_fp16=use_fp16)
+    # 固定测试网络输出节点名称，便于 AOT 导出
+    logits_test = tf.identity(logits_test, name="logits_test")
 
-    # Define loss and optimizer (with train logits, for dropout to take effect)
-    # sparse_softmax_cross_entropy_with_logits() do not use the one hot version of labels
-    loss_op = tf.reduce_mean(tf.nn.sparse_softmax_cross_entropy_with_logits(
-        logits=logits_train, labels=y))
+    # Define optimizer
     optimizer = tf.train.AdamOptimizer(learning_rate=l_rate)
-    train_op = optimizer.minimize(loss_op)
-
-    # Evaluate model (with test logits, for dropout to be disabled)
-    correct_pred = tf.equal(tf.argmax(logits_train, 1), tf.cast(y, tf.int64))
-    accuracy = tf.reduce_mean(tf.cast(correct_pred, tf.float32))
+    if use_fp16:
+        # 动态 loss scaling，避免 float16 梯度下溢
+        optimizer = tf.contrib.mixed_precision.LossScaleOptimizer(
+            optimizer, tf.contrib.mixed_precision.ExponentialUpdateLossScaleManager(2 ** 15, 2000))
+    # 单次 sess.run 内连续执行 n_inner 个训练 step，减少 Python 与设备之间的往返
+    n_inner = tf.placeholder(tf.int32, shape=[])
+
+    def train_step(i, batch_loss, batch_acc):
+        """tf.while_loop 循环体：读取下一个 batch 并执行一次参数更新，
+        最后一个 step 更新后在同一 batch 上计算 loss 及 ACC
+
+        Optimizer 在 init_scope 中创建 slot 变量，不受 while_loop 控制流影响
+        """
+        # 依赖上一轮的计数，保证每个 step 在上一次参数更新之后执行
+        with tf.control_dependencies([i]):
+            batch_x, batch_y = iterator.get_next()
+        if b_size > 0:
+            # 训练集 repeat 后每个 batch 均为 b_size 个样本，声明固定维度供 XLA 编译
+            batch_x.set_shape([b_size, data_height, data_width, 1])
+            batch_y.set_shape([b_size])
+        # Define loss (with train logits, for dropout to take effect)
+        # sparse_softmax_cross_entropy_with_logits() do not use the one hot version of labels
+        logits, _, _ = conv_net(
+            batch_x, n_classes, conv1_h, conv1_w, conv2_h, conv2_w, filter2, dropout, reuse=True, is_training=True, data_format=data_format, use_fp16=use_fp16)
+        step_loss = tf.reduce_mean(tf.nn.sparse_softmax_cross_entropy_with_logits(
+            logits=logits, labels=batch_y))
+        with tf.control_dependencies([optimizer.minimize(step_loss)]):
+            # 参数更新之后再读取同一 batch
+            trained_x = tf.identity(batch_x)
+
+        def evaluate():
+            """计算ACC时保留所有单元数"""
+            eval_logits, _, _ = conv_net(
+                trained_x, n_classes, conv1_h, conv1_w, conv2_h, conv2_w, filter2, dropout, reuse=True, is_training=False, data_format=data_format, use_fp16=use_fp16)
+            eval_loss = tf.reduce_mean(tf.nn.sparse_softmax_cross_entropy_with_logits(
+                logits=eval_logits, labels=batch_y))
+            correct_pred = tf.equal(tf.argmax(
+                eval_logits, 1, output_type=tf.int32), batch_y)
+            return eval_loss, tf.reduce_mean(tf.cast(correct_pred, tf.float32))
+
+        # 只在最后一个 step 计算，避免每个 step 多一次前向计算
+        batch_loss, batch_acc = tf.cond(tf.equal(i + 1, n_inner), evaluate,
+                                        lambda: (tf.identity(batch_loss), tf.identity(batch_acc)))
+        with tf.control_dependencies([trained_x]):
+            return i + 1, batch_loss, batch_acc
+
+    train_loop_op = tf.while_loop(lambda i, *_: i < n_inner, train_step,
+                                  [tf.constant(0), tf.constant(0.0), tf.constant(0.0)],
+                                  parallel_iterations=1, back_prop=False)
+
+    # 测试集预测分类在图内计算，只取回 int32 分类结果而非全部 logits
+    pred_op = tf.argmax(logits_test, axis=1, output_type=tf.int32)
+    # 测试集 loss 及 ACC 以 streaming metrics 跨 batch 累计，只取回标量
+    with tf.variable_scope('test_metrics'):
+        test_loss, test_loss_update = tf.metrics.mean(tf.nn.sparse_softmax_cross_entropy_with_logits(
+            logits=logits_test, labels=y))
+        test_acc, test_acc_update = tf.metrics.accuracy(
+            labels=y, predictions=pred_op)
+    metrics_init = tf.variables_initializer(
+        tf.local_variables(scope='test_metrics'))
 
     # Initialize the variables (i.e. assign their default value)
     init = tf.global_variables_initializer()
 
     # Saver object
     # saver = tf.train.Saver()
-    # 读取数据
-    traning_set, training_labels = get_datasets(d_path)
+
+    # 开启 XLA JIT 编译，融合 conv + bias + ReLU 及 dense + dropout 等算子
+    config = tf.ConfigProto(log_device_placement=False)
+    config.graph_options.optimizer_options.global_jit_level = tf.OptimizerOptions.ON_1
 
     # 设定 K-fold 分割器
     rs = KFold(n_splits=folds, shuffle=True, random_state=seed)
@@ -224,85 +411,80 @@ def run_model(d_path, l_rate, n_steps, d_rate, conv1_h, conv1_w, conv2_h, conv2_
     cv_index_set = rs.split(training_labels)
     k_fold_step = 1  # 初始化折数
     # 暂存每次选中的测试集和对应预测结果
-    test_cache = pred_cache = test_index_cache = np.array([], dtype=np.int)
-    f_cache = np.zeros([1, 1024], dtype=np.float)
+    test_cache, pred_cache, test_index_cache = list(), list(), list()
+    f_chunks = list()
 
-    # k-fold cross-validation
-    for train_index, test_index in cv_index_set:
-        print("\nThe training set size:", len(train_index),
-              "The test set size:", len(test_index))
-        # Start training
-        with tf.Session(config=tf.ConfigProto(log_device_placement=False)) as sess:
+    # Start training
+    # 所有 fold 共用同一个 Session，每个 fold 开始时重新初始化变量
+    with tf.Session(config=config) as sess:
 
+        # k-fold cross-validation
+        for train_index, test_index in cv_index_set:
+            print("\nThe training set size:", len(train_index),
+                  "The test set size:", len(test_index))
             # Run the initializer
             sess.run(init)
-            # 测试集矩阵初始化
-            batch_test_x = read_data(traning_set[test_index[0]], data_height, data_width).reshape(
-                1, data_height, data_width, 1)
-            batch_test_y = training_labels[test_index[0]]
-
-            for step in range(1, n_steps + 1):
-                # 每次选取一定数量样本进行计算（默认全部样本进入训练）
-                sample_index = train_index
-                # if b_size == 0:
-                #     sample_index = train_index
-                # else:
-                #     sample_index = resample(
-                #         train_index, replace=False, n_samples=b_size)
-                batch_x = read_data(traning_set[sample_index[0]], data_height, data_width).reshape(
-                    1, data_height, data_width, 1)
-                batch_y = training_labels[sample_index[0]]
-                for i in sample_index[1:]:
-                    batch_x = np.vstack((batch_x, read_data(
-                        traning_set[i], data_height, data_width).reshape(1, data_height, data_width, 1)))
-                    batch_y = np.hstack((batch_y, training_labels[i]))
+            sess.run(train_init, feed_dict={train_idx: train_index})
+
+            step, n_run = 0, 0
+            while step < n_steps:
+                # 每次 sess.run 连续执行 steps_per_run 个训练 step
+                inner_steps = min(steps_per_run, n_steps - step)
                 # Run optimization op (backprop)
-                sess.run(train_op, feed_dict={
-                         X: batch_x, y: batch_y, dropout: d_rate})
-                if step % DISPLAY_STEP == 0 or step == 1:
-                    # Calculate batch loss and accuracy
-                    # 计算ACC时保留所有单元数
-                    loss, acc = sess.run([loss_op, accuracy], feed_dict={
-                                         X: batch_x, y: batch_y, dropout: 0})
+                # 同时取回最后一个训练 batch 在参数更新后的 loss 及 ACC
+                _, loss, acc = sess.run(train_loop_op, feed_dict={
+                                        n_inner: inner_steps, dropout: d_rate})
+                step += inner_steps
+                n_run += 1
+                # 每 DISPLAY_STEP 次 sess.run 输出一次训练状态
+                if n_run % DISPLAY_STEP == 0 or n_run == 1 or step == n_steps:
                     print("\nTraining Step: {0}, Training Accuracy = {1:.6f}, Batch Loss = {2:.6f}".format(
                         step, acc, loss))
 
             print("\nTraining Finished!")
 
-            # 测试集评估模型
-            for i in test_index[1:]:
-                batch_test_x = np.vstack((batch_test_x, read_data(
-                    traning_set[i], data_height, data_width).reshape(1, data_height, data_width, 1)))
-                batch_test_y = np.hstack((batch_test_y, training_labels[i]))
-
-            lossTest, accTest, predVal, fData = sess.run([loss_op, accuracy, logits_test, f1024_test], feed_dict={
-                                                         X: batch_test_x, y: batch_test_y, dropout: 0})
+            # 测试集评估模型（测试集未打乱，batch 顺序与 test_index 一致）
+            sess.run([test_init, metrics_init], feed_dict={test_idx: test_index})
+            while True:
+                try:
+                    _, _, argmax_pred, fData = sess.run(
+                        [test_loss_update, test_acc_update, pred_op, f1024_test], feed_dict={dropout: 0})
+                except tf.errors.OutOfRangeError:
+                    break
+                # 暂存预测结果
+                pred_cache.extend(argmax_pred)
+                # 暂存全连接层数据(1024个单元)
+                f_chunks.append(fData)
+            lossTest, accTest = sess.run([test_loss, test_acc])
 
             # print("\n", fData)
             print("\nFold:", k_fold_step, ", Test Accuracy =", "{:.6f}".format(
                 accTest), ", Test Loss =", "{:.6f}".format(lossTest), ", Test Size:", test_index.shape[0])
 
-            # One-hot 矩阵转换为原始分类矩阵
-            # argmax_test = batch_test_y
-            argmax_pred = np.argmax(predVal, axis=1)
-            # 暂存每次选中的测试集和预测结果
-            test_cache = np.concatenate((test_cache, batch_test_y))
-            pred_cache = np.concatenate((pred_cache, argmax_pred))
-            test_index_cache = np.concatenate((test_index_cache, test_index))
-            # 暂存全连接层数据(1024个单元)
-            f_cache = np.vstack((f_cache, fData))
+            # 暂存每次选中的测试集
+            test_cache.extend(sample_labels[test_index])
+            test_index_cache.extend(test_index)
+
+            print("\n=================================================================================")
 
-        print("\n=================================================================================")
+            # 每个fold训练结束后次数 +1
+            k_fold_step += 1
 
-        # 每个fold训练结束后次数 +1
-        k_fold_step += 1
+        if aot_dir is not None:
+            # 以最后一个 fold 的模型及测试集维度导出 AOT 编译所需文件
+            from .utils import export_aot_graph
+            export_aot_graph(sess, "logits_test", "batch",
+                             [len(test_index), data_height, data_width, 1], aot_dir)
 
     # 模型评估结果输出
     from .utils import model_evaluation
+    test_cache = np.asarray(test_cache)
+    pred_cache = np.asarray(pred_cache)
     model_evaluation(n_classes, test_cache, pred_cache)
     # 输出全连接层特征数据
     f_list = ["f" + str(i) for i in range(1024)]
-    df = pd.DataFrame(f_cache[1:, ], index=test_cache, columns=f_list)
+    f_cache = np.concatenate(f_chunks, axis=0)
+    df = pd.DataFrame(f_cache, index=test_cache, columns=f_list)
     samples_name = list()
     for i in test_index_cache:
         samples_name.append(traning_set[i])
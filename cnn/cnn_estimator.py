@@ -1,5 +1,6 @@
 # -*- coding: utf-8 -*-
 """ Build an Basic ConvNet for training membrane dataset in TensorFlow.
+Run from the project root as a module: python -m cnn.cnn_estimator
 
 convolutional layer1 + max pooling;
 convolutional layer2 + max pooling;
@@ -14,7 +15,9 @@ from __future__ import print_function
 import os
 import numpy as np
 import tensorflow as tf
-from sklearn.preprocessing import StandardScaler
+# 样本读取与网络结构与 cnn_bio 共用同一份参数化实现
+from .cnn_bio import get_datasets, read_data, conv_net
+from .utils import load_samples
 
 os.environ['TF_CPP_MIN_LOG_LEVEL'] = '2'
 
@@ -27,122 +30,6 @@ DATA_WIDTH = 20  # CHANGE HERE, the data width
 CHANNELS = 1  # change to 1 if grayscale
 
 
-def get_datasets(dataset_path):
-    """读取样本数据集
-
-    Args:
-     dataset_path: 数据集路径
-
-    Returns:
-     返回样本文件列表及对应分类列表
-    """
-    sample_paths, sample_labels = list(), list()
-    # 获取文件夹下所有数据集文件名
-    files = os.listdir(dataset_path)
-    for filename in files:
-        filepath = os.path.join(dataset_path, filename)
-        if os.path.isfile(filepath):
-            f = open(filepath, 'r', encoding='utf-8')
-            # 读取样本首行分类信息
-            m_class_info = f.readline().split()
-            f.close()  # sample 文件完整路径
-            # 登记相关信息至训练集列表
-            sample_paths.append(filepath)
-            sample_labels.append(int(m_class_info[1]) - 1)
-    return sample_paths, sample_labels
-
-
-def read_data(file_path):
-    """读取样本矩阵信息
-
-    Args:
-     file_path: 样本文件名称
-
-    Returns:
-     numpy 格式矩阵
-    """
-    result = list()
-    with open(file_path, 'r', encoding='utf-8') as f:
-        # 读取首行分类信息
-        for line in f.readlines():
-            line = line.strip()
-            # 过滤首行分类信息和文件末尾空行
-            if len(line) > 0 and not line.startswith('>'):
-                # 逐行存入矩阵信息
-                result.append(line.split())
-    # 转换至 numpy array 格式
-    mat = np.array(result, dtype=np.float)
-    if mat.shape[0] > DATA_HEIGHT:
-        # 超出 Max Height 则矩阵做截断
-        new_mat = mat[0:DATA_HEIGHT, ]
-    else:
-        # 矩阵填充 padding with 0
-        new_mat = np.lib.pad(mat, ((
-            0, DATA_HEIGHT - mat.shape[0]), (0, 0)), 'constant', constant_values=0)
-    # 标准化处理
-    scale = StandardScaler()
-    # 按列 Standardize features by removing the mean and scaling to unit variance
-    scale.fit(new_mat)
-    # 2-D array 转换为 3-D array [Height, Width, Channel]
-    new_mat = scale.transform(new_mat)[:, :, np.newaxis]
-    return new_mat.astype(np.float32)
-
-
-def conv_net(x_dict, n_classes, dropout, reuse, is_training):
-    """ 基本卷积神经网络构建
-
-    Args:
-     x: 4-D 输入矩阵 [Batch Size, Height, Width, Channel] 在给定的 4-D input 与 filter下计算2D卷积
-     n_classes: 输出分类数
-     dropout: Dropout 概率
-     reuse: 是否应用同样的权重矩阵
-     is_training: 网络是否在训练状态
-
-    Returns:
-     全连接层输出
-
-    """
-    # Define a scope for reusing the variables
-    with tf.variable_scope('ConvNet', reuse=reuse):
-        """
-        data input is a 1-D vector of (DATA_HEIGHT*DATA_WIDTH) features
-        Reshape to format [Height x Width x Channel]
-        Tensor input become 4-D: [Batch Size, Height, Width, Channel]
-        特征矩阵调整为 4-D 输入，-1 代表每次可以自定义样本输入数量
-        在给定的 4-D input与 filter下计算2D卷积
-        """
-        # TF Estimator 的输入为字典结构，从而可以更加通用
-        x = x_dict['membranes']
-
-        # Convolution Layer 1 with 32 filters and a kernel size of 5
-        # 卷积层1：卷积核大小为 5x5，卷积核数量为 32， 激活函数使用 RELU
-        conv1 = tf.layers.conv2d(x, 32, 5, activation=tf.nn.relu)
-        # Max Pooling (down-sampling) with strides of 2 and kernel size of 2
-        # 采用 2x2 维度的最大化池化操作，步长为2
-        pool1 = tf.layers.max_pooling2d(conv1, 2, 2)
-
-        # Convolution Layer 2 with 64 filters and a kernel size of 3
-        # 卷积层2：卷积核大小为 3x3，卷积核数量为 64， 激活函数使用 RELU
-        conv2 = tf.layers.conv2d(pool1, 64, 3, activation=tf.nn.relu)
-        # Max Pooling (down-sampling) with strides of 2 and kernel size of 2
-        # 采用 2x2 维度的最大化池化操作，步长为2
-        pool2 = tf.layers.max_pooling2d(conv2, 2, 2)
-
-        # Flatten the data to a 1-D vector for the fully connected layer
-        fc1 = tf.contrib.layers.flatten(pool2)
-
-        # Fully connected layer (in contrib folder for now)
-        # 全链接层具有1024神经元
-        fc1 = tf.layers.dense(fc1, units=1024)
-        # Apply Dropout (if is_training is False, dropout is not applied)
-        # 对全链接层的数据加入dropout操作，防止过拟合
-        fc1 = tf.layers.dropout(fc1, rate=dropout, training=is_training)
-
-        # Output layer, class prediction
-        out = tf.layers.dense(fc1, n_classes)
-    return out
-
-
 def model_fn(features, labels, mode, params):
     """ Define the model function (following TF Estimator Template)
     使用TensorFlow Estimator 构建神经网络模型
@@ -159,10 +46,12 @@ def model_fn(features, labels, mode, params):
     # Build the neural network
     # Because Dropout have different behavior at training and prediction time, we
     # need to create 2 distinct computation graphs that still share the same weights.
-    logits_train = conv_net(
-        features, N_CLASSES, params['dropout_rate'], reuse=False, is_training=True)
-    logits_test = conv_net(
-        features, N_CLASSES, params['dropout_rate'], reuse=True, is_training=False)
+    # TF Estimator 的输入为字典结构，从而可以更加通用
+    x = features['membranes']
+    logits_train, _, _ = conv_net(
+        x, N_CLASSES, 5, 5, 3, 3, 64, params['dropout_rate'], reuse=False, is_training=True, init_stddev=None)
+    logits_test, _, _ = conv_net(
+        x, N_CLASSES, 5, 5, 3, 3, 64, params['dropout_rate'], reuse=True, is_training=False, init_stddev=None)
 
     # Predictions
     # 一个转换为具体分类，一个输出为概率
@@ -216,14 +105,17 @@ def run_model(d_path, l_rate, n_steps, b_size, d_rate, folds, seed=None):
     # 读取数据
     traning_set, training_labels = get_datasets(d_path)
 
-    # 选取一部分索引进行测试
-    sample_list = read_data(traning_set[b_size]).reshape(
-        1, DATA_HEIGHT, DATA_WIDTH, 1)
-    label_list = training_labels[b_size]
-    for i in range(b_size):
-        sample_list = np.vstack((sample_list, read_data(
-            traning_set[i]).reshape(1, DATA_HEIGHT, DATA_WIDTH, 1)))
-        label_list = np.hstack((label_list, training_labels[i]))
+    # 选取一部分索引进行测试（多线程并行读取样本）
+    sample_list = load_samples(lambda path: read_data(path, DATA_HEIGHT, DATA_WIDTH),
+                               traning_set[:b_size + 1], (DATA_HEIGHT, DATA_WIDTH, 1))
+    label_list = np.array(training_labels[:b_size + 1], dtype=np.int32)
+    # 标准化处理：按列统计全部样本的均值与标准差后统一 Standardize，
+    # 不再对每个样本单独 fit StandardScaler
+    mean = sample_list.mean(axis=(0, 1), keepdims=True)
+    std = sample_list.std(axis=(0, 1), keepdims=True)
+    # 与 StandardScaler 一致，方差为 0 的列不做缩放
+    std[std == 0] = 1
+    sample_list = (sample_list - mean) / std
     # print(sample_list[0])
     print(sample_list.shape)
     print(label_list.shape)
@@ -249,6 +141,7 @@ def run_model(d_path, l_rate, n_steps, b_size, d_rate, folds, seed=None):
 
     # Save your model
     # saver.save(sess, 'membrane_tf_model')
+# 模块内使用相对导入，需在项目根目录以 python -m cnn.cnn_estimator 方式运行
 if __name__ == "__main__":
     run_model("D:\\datasets\\membrane", l_rate=0.01,
               n_steps=5, b_size=100, d_rate=0.2, folds=10)
@@ -70,20 +70,15 @@ def read_data(file_path, data_height, data_width):
                 # 逐行存入矩阵信息
                 result.append(line.split())
     # 转换至 numpy array 格式
-    mat = np.array(result, dtype=np.float)
+    mat = np.array(result, dtype=np.float32)
     if mat.shape[0] > data_height:
         # 超出 Max Height 则矩阵做截断
         new_mat = mat[0:data_height, ]
     else:
         # 矩阵填充 padding with 0
         new_mat = np.lib.pad(mat, ((
-            0, data_height - mat.shape[0]), (0, 0)), 'constant', constant_values=0)
-    # 标准化处理
-    # scale = StandardScaler()
-    # 按列 Standardize features by removing the mean and scaling to unit variance
-    # scale.fit(mat)
+            0, data_height - mat.shape[0]), (0, 0)), 'constant', constant_values=np.float32(0))
     # 2-D array 转换为 3-D array [Height, Width, Channel]
-    # new_mat = scale.transform(mat)[:, :, np.newaxis]
     new_mat = new_mat.reshape((data_height, data_width, 1))
     return new_mat
 
@@ -222,16 +217,13 @@ def run_model(d_path, l_rate, n_steps, n_rate, d_rate, conv1_h, conv1_w, conv2_h
 
         # Run the initializer
         sess.run(init)
-        # 训练集矩阵初始化（乱序排列）
-        batch_x = read_data(training_set[0], data_height, data_width).reshape(
-            1, data_height, data_width, 1)
-        batch_y = training_labels[0]
-        train_index = np.arange(1, len(training_labels))
+        # 训练集矩阵初始化（乱序排列，多线程并行读取样本）
+        from .utils import load_samples
+        train_index = np.arange(len(training_labels))
         np.random.shuffle(train_index)
-        for i in train_index:
-            batch_x = np.vstack(
-                (batch_x, read_data(training_set[i], data_height, data_width).reshape(1, data_height, data_width, 1)))
-            batch_y = np.hstack((batch_y, training_labels[i]))
+        batch_x = load_samples(lambda path: read_data(path, data_height, data_width),
+                               [training_set[i] for i in train_index], (data_height, data_width, 1))
+        batch_y = np.array(training_labels, dtype=np.int32)[train_index]
 
         # Run optimization op (backprop)
         for step in range(1, n_steps + 1):
@@ -255,9 +247,7 @@ def run_model(d_path, l_rate, n_steps, n_rate, d_rate, conv1_h, conv1_w, conv2_h
         f1024_list = ["f" + str(i) for i in range(f1024.shape[1])]
         df = pd.DataFrame(fdata, index=batch_y, columns=f_list)
         df_1024 = pd.DataFrame(f1024, index=batch_y, columns=f1024_list)
-        samples_name = [training_set[0]]
-        for i in train_index:
-            samples_name.append(training_set[i])
+        samples_name = [training_set[i] for i in train_index]
         df.insert(0, "Samples", samples_name)
         df_1024.insert(0, "Samples", samples_name)
         df.to_csv("f_output.csv", index_label="Class")
@@ -16,7 +16,6 @@ import random
 import numpy as np
 import pandas as pd
 import tensorflow as tf
-# from sklearn.preprocessing import StandardScaler
 from sklearn.model_selection import KFold
 # from sklearn.utils import resample  # 添加 subsampling 工具类
 
@@ -85,13 +84,8 @@ def read_data(file_path):
                 # 逐行存入矩阵信息
                 result.append(line.split())
     # 转换至 numpy array 格式
-    mat = np.array(result, dtype=np.float)
-    # 标准化处理
-    # scale = StandardScaler()
-    # 按列 Standardize features by removing the mean and scaling to unit variance
-    # scale.fit(mat)
+    mat = np.array(result, dtype=np.float32)
     # 2-D array 转换为 3-D array [Height, Width, Channel]
-    # new_mat = scale.transform(mat)[:, :, np.newaxis]
     new_mat = mat.reshape((DATA_HEIGHT, DATA_WIDTH, 1))
     return new_mat
 
@@ -205,6 +199,8 @@ def run_model(d_path, l_rate, n_steps, n_rate, d_rate, folds, conv1_h, conv1_w,
     # saver = tf.train.Saver()
     # 读取数据
     traning_set, training_labels = get_datasets(d_path, n_rate)
+    sample_labels = np.array(training_labels, dtype=np.int32)
+    from .utils import load_samples
 
     # 设定 K-fold 分割器
     rs = KFold(n_splits=folds, shuffle=True, random_state=seed)
@@ -212,8 +208,8 @@ def run_model(d_path, l_rate, n_steps, n_rate, d_rate, folds, conv1_h, conv1_w,
     cv_index_set = rs.split(training_labels)
     k_fold_step = 1  # 初始化折数
     # 暂存每次选中的测试集和对应预测结果
-    test_cache = pred_cache = test_index_cache = np.array([], dtype=np.int)
-    f_cache = np.zeros([1, 1024], dtype=np.float)
+    test_cache, pred_cache, test_index_cache = list(), list(), list()
+    f_chunks = list()
 
     # k-fold cross-validation
     for train_index, test_index in cv_index_set:
@@ -222,22 +218,13 @@ def run_model(d_path, l_rate, n_steps, n_rate, d_rate, folds, conv1_h, conv1_w,
 
             # Run the initializer
             sess.run(init)
-            # 测试集矩阵初始化
-            batch_test_x = read_data(traning_set[test_index[0]]).reshape(
-                1, DATA_HEIGHT, DATA_WIDTH, 1)
-            batch_test_y = training_labels[test_index[0]]
-
             for step in range(1, n_steps + 1):
                 # 所有去除测试集样本进入训练
                 sample_index = train_index
-                # 数据集构造
-                batch_x = read_data(traning_set[sample_index[0]]).reshape(
-                    1, DATA_HEIGHT, DATA_WIDTH, 1)
-                batch_y = training_labels[sample_index[0]]
-                for i in sample_index[1:]:
-                    batch_x = np.vstack(
-                        (batch_x, read_data(traning_set[i]).reshape(1, DATA_HEIGHT, DATA_WIDTH, 1)))
-                    batch_y = np.hstack((batch_y, training_labels[i]))
+                # 数据集构造（多线程并行读取样本）
+                batch_x = load_samples(read_data, [traning_set[i] for i in sample_index],
+                                       (DATA_HEIGHT, DATA_WIDTH, 1))
+                batch_y = sample_labels[sample_index]
                 # Run optimization op (backprop)
                 sess.run(train_op, feed_dict={
                          X: batch_x, y: batch_y, dropout: d_rate})
@@ -252,10 +239,9 @@ def run_model(d_path, l_rate, n_steps, n_rate, d_rate, folds, conv1_h, conv1_w,
             print("\nTraining Finished!")
 
             # 测试集评估模型
-            for i in test_index[1:]:
-                batch_test_x = np.vstack((batch_test_x, read_data(
-                    traning_set[i]).reshape(1, DATA_HEIGHT, DATA_WIDTH, 1)))
-                batch_test_y = np.hstack((batch_test_y, training_labels[i]))
+            batch_test_x = load_samples(read_data, [traning_set[i] for i in test_index],
+                                        (DATA_HEIGHT, DATA_WIDTH, 1))
+            batch_test_y = sample_labels[test_index]
 
             lossTest, accTest, predVal, fData = sess.run([loss_op, accuracy, logits_test, features_test], feed_dict={
                 X: batch_test_x, y: batch_test_y, dropout: 0})
@@ -268,11 +254,11 @@ def run_model(d_path, l_rate, n_steps, n_rate, d_rate, folds, conv1_h, conv1_w,
             # argmax_test = batch_test_y
             argmax_pred = np.argmax(predVal, axis=1)
             # 暂存每次选中的测试集和预测结果
-            test_cache = np.concatenate((test_cache, batch_test_y))
-            pred_cache = np.concatenate((pred_cache, argmax_pred))
-            test_index_cache = np.concatenate((test_index_cache, test_index))
+            test_cache.extend(batch_test_y)
+            pred_cache.extend(argmax_pred)
+            test_index_cache.extend(test_index)
             # 暂存全连接层数据(1024个单元)
-            f_cache = np.vstack((f_cache, fData))
+            f_chunks.append(fData)
 
         print("\n=================================================================================")
 
@@ -281,10 +267,13 @@ def run_model(d_path, l_rate, n_steps, n_rate, d_rate, folds, conv1_h, conv1_w,
 
     # 模型评估结果输出
     from .utils import bi_model_evaluation
+    test_cache = np.asarray(test_cache)
+    pred_cache = np.asarray(pred_cache)
     bi_model_evaluation(test_cache, pred_cache)
     # 输出全连接层特征数据
     f_list = ["f" + str(i) for i in range(1024)]
-    df = pd.DataFrame(f_cache[1:, ], index=test_cache, columns=f_list)
+    f_cache = np.concatenate(f_chunks, axis=0)
+    df = pd.DataFrame(f_cache, index=test_cache, columns=f_list)
     samples_name = list()
     for i in test_index_cache:
         samples_name.append(traning_set[i])
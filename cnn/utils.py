@@ -3,6 +3,8 @@
 The :mod:`utils` module includes various utilities.
 """
 import math
+import os
+from concurrent.futures import ThreadPoolExecutor
 import numpy as np
 import pandas as pd
 # 计算 ACC 混淆矩阵 输出 recall f1等指标
@@ -10,6 +12,9 @@ from sklearn.metrics import accuracy_score, confusion_matrix, classification_rep
 
 __author__ = "Min"
 
+# 样本文件读取线程池（文件读取与解析相互独立，多线程并行进行）
+READ_POOL = ThreadPoolExecutor(max_workers=os.cpu_count())
+
 
 def matthews_corrcoef(c_matrix):
     """多分类问题MCC计算
@@ -122,6 +127,55 @@ def bi_model_evaluation(y_true, y_pred):
                                 target_names=class_names, digits=6))
 
 
+def load_samples(read_fn, file_paths, sample_shape, out=None):
+    """多线程并行读取样本矩阵，并按顺序写入预先分配的矩阵
+
+    Args:
+    read_fn : 单个样本读取函数，参数为样本文件路径
+    file_paths : 样本文件路径列表
+    sample_shape : 单个样本矩阵维度，如 (Height, Width, Channel)
+    out : 结果写入的矩阵（可为 memmap），为 None 时新建 float32 矩阵
+
+    Returns:
+    array, shape = [n_samples] + sample_shape
+    """
+    if out is None:
+        out = np.empty((len(file_paths),) + tuple(sample_shape), dtype=np.float32)
+    for i, mat in enumerate(READ_POOL.map(read_fn, file_paths)):
+        out[i] = mat
+    return out
+
+
+def export_aot_graph(sess, fetch_node, feed_node, feed_shape, export_dir, cpp_class="BioCNN"):
+    """导出冻结的测试网络及 tfcompile (XLA AOT) 配置文件，用于生成固定输入维度的 C++ 推理代码
+
+    Args:
+    sess : 训练完成的 tf.Session
+    fetch_node : 输出节点名称
+    feed_node : 输入节点名称（第 0 个输出为样本矩阵）
+    feed_shape : 输入矩阵维度 [Batch Size, Height, Width, Channel]，AOT 编译要求固定维度
+    export_dir : 输出目录
+    cpp_class : tfcompile 生成的 C++ 类名
+    """
+    import tensorflow as tf
+    if not os.path.isdir(export_dir):
+        os.makedirs(export_dir)
+    # 变量转换为常量，并只保留输出节点依赖的子图
+    graph_def = tf.graph_util.convert_variables_to_constants(
+        sess, sess.graph.as_graph_def(), [fetch_node])
+    tf.train.write_graph(graph_def, export_dir, "frozen.pb", as_text=False)
+    dims = "".join(" dim {{ size: {0} }}".format(d) for d in feed_shape)
+    config_path = os.path.join(export_dir, "aot_config.pbtxt")
+    with open(config_path, "w") as f:
+        f.write('feed {{ id {{ node_name: "{0}" }} shape {{{1} }} }}\n'.format(
+            feed_node, dims))
+        f.write('fetch {{ id {{ node_name: "{0}" }} }}\n'.format(fetch_node))
+    print("\nThe frozen graph and AOT config have been saved to '{0}', compile with:".format(
+        export_dir))
+    print("\ntfcompile --graph={0} --config={1} --cpp_class={2}".format(
+        os.path.join(export_dir, "frozen.pb"), config_path, cpp_class))
+
+
 def get_timestamp(fmt='%Y/%m/%d %H:%M:%S'):
     '''Returns a string that contains the current date and time.
 